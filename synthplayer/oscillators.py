@@ -7,12 +7,33 @@ Written by Irmen de Jong (irmen@razorvine.net) - License: GNU LGPL 3.
 """
 
 import itertools
+import functools
 from math import pi, sin, cos, log, fabs, floor, sqrt
 import sys
 import random
-from typing import Generator, List, Sequence, Optional, Tuple, Iterator
+import platform
+import array
+from typing import Callable, Generator, List, Sequence, Optional, Tuple, Iterator, Any
 from abc import abstractmethod, ABC
 from . import params
+try:
+    import numpy
+except ImportError:
+    numpy = None   # type: ignore
+try:
+    import numba
+except ImportError:
+    numba = None   # type: ignore
+
+running_on_pypy = platform.python_implementation().lower() == "pypy"
+
+# a full period in radians, precomputed because it is used everywhere
+two_pi = 2.0*pi
+inv_two_pi = 1.0/two_pi
+
+if running_on_pypy:
+    # Pypy's jit compiles the plain python loops into fast code, going through numpy is slower there.
+    numpy = numba = None   # type: ignore
 
 
 __all__ = ["Oscillator", "OscillatorFromSingleSamples", "Filter", "Sine", "Triangle", "Square",
@@ -22,6 +43,23 @@ __all__ = ["Oscillator", "OscillatorFromSingleSamples", "Filter", "Sine", "Trian
            "ClipFilter", "AbsFilter", "NullFilter"]
 
 
+def vectorized_blocks(list_blocks: Callable[[Any], Iterator[List[float]]]) \
+        -> Callable[[Any], Generator[List[float], None, None]]:
+    """
+    Decorator for the blocks() method of the oscillators that also have a vectorized array_blocks():
+    if numpy is available the blocks are converted from those, otherwise the decorated method
+    (the plain python code) produces them.
+    """
+    @functools.wraps(list_blocks)
+    def blocks(self: "Oscillator") -> Generator[List[float], None, None]:
+        if numpy:
+            for array_block in self.array_blocks():
+                yield array_block.tolist()
+        else:
+            yield from list_blocks(self)
+    return blocks
+
+
 class Oscillator(ABC):
     """
     Oscillator base class for several types of waveforms.
@@ -36,6 +74,9 @@ class Oscillator(ABC):
     rather than single individual values. When running this code using Pypy this
     results in a really big speedup. Also, usually, its not single values we're interested in,
     but rather a waveform.
+
+    If numpy is available, several oscillators compute their blocks in a vectorized
+    way, and can also return them directly as numpy arrays via array_blocks().
     """
     def __init__(self, samplerate: int = 0) -> None:
         self.samplerate = samplerate or params.norm_samplerate
@@ -44,6 +85,11 @@ class Oscillator(ABC):
     def blocks(self) -> Generator[List[float], None, None]:
         pass
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        """Like blocks() but returns the blocks as numpy float arrays. (requires numpy)"""
+        for block in self.blocks():
+            yield numpy.array(block)
+
 
 class OscillatorFromSingleSamples(Oscillator):
     """
@@ -85,28 +131,64 @@ class EnvelopeFilter(Filter):
         self._sustain_level = sustain_level
         self._release = release
         self._stop_at_end = stop_at_end
+        self._envelope = None    # type: Optional[Sequence[float]]
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        src = self.single_samples()
-        try:
+        blocksize = params.norm_osc_blocksize
+        envelope = self.envelope()
+        source_blocks = self.sources[0].blocks()
+        for start in range(0, len(envelope), blocksize):
+            try:
+                block = next(source_blocks)
+            except StopIteration:
+                return
+            block = [v*amp for v, amp in zip(block, envelope[start:start+blocksize])]
+            if not self._stop_at_end and len(block) < blocksize:
+                block.extend([0.0] * (blocksize-len(block)))
+            yield block
+        if not self._stop_at_end:
+            silence = [0.0] * blocksize
             while True:
-                v = list(itertools.islice(src, params.norm_osc_blocksize))
-                if not v:
-                    return
-                yield v
-        except StopIteration:
-            return
+                yield list(silence)
 
-    def samples_from_source(self) -> Generator[float, None, None]:
-        try:
-            blocks = self.sources[0].blocks()
+    def array_blocks(self) -> Generator[Any, None, None]:
+        yield from self.enveloped_array_blocks()
+        if not self._stop_at_end:
             while True:
-                yield from next(blocks)
-        except StopIteration:
-            return
+                yield numpy.zeros(params.norm_osc_blocksize)
+
+    def enveloped_array_blocks(self) -> Generator[Any, None, None]:
+        # the blocks until the end of the envelope (requires numpy)
+        envelope = self.envelope()
+        blocksize = params.norm_osc_blocksize
+        source_blocks = self.sources[0].array_blocks()
+        for start in range(0, len(envelope), blocksize):
+            try:
+                block = next(source_blocks)
+            except StopIteration:
+                return
+            amps = envelope[start:start+blocksize]
+            length = min(len(block), len(amps))
+            block = block[:length] * amps[:length]
+            if not self._stop_at_end and length < blocksize:
+                block = numpy.concatenate((block, numpy.zeros(blocksize-length)))
+            yield block
+
+    def envelope(self) -> Sequence[float]:
+        """
+        The amplitude factors of the envelope for every sample, from the start of the attack
+        until the end of the release. (a numpy array, if numpy is available).
+        It is computed only once.
+        """
+        if self._envelope is None:
+            if numpy:
+                self._envelope = self._envelope_numpy()
+            else:
+                self._envelope = list(self._envelope_amplitudes())
+        return self._envelope
 
-    def single_samples(self) -> Generator[float, None, None]:
-        oscillator = self.samples_from_source()
+    def _envelope_amplitudes(self) -> Generator[float, None, None]:
         time = 0.0
         end_time_decay = self._attack + self._decay
         end_time_sustain = end_time_decay + self._sustain
@@ -116,30 +198,52 @@ class EnvelopeFilter(Filter):
             amp_change = 1.0/self._attack*increment
             amp = 0.0
             while time < self._attack:
-                yield next(oscillator)*amp
+                yield amp
                 amp += amp_change
                 time += increment
         if self._decay:
             amp = 1.0
             amp_change = (self._sustain_level-1.0)/self._decay*increment
             while time < end_time_decay:
-                yield next(oscillator)*amp
+                yield amp
                 amp += amp_change
                 time += increment
         while time < end_time_sustain:
-            yield next(oscillator)*self._sustain_level
+            yield self._sustain_level
             time += increment
         if self._release:
             amp = self._sustain_level
             amp_change = (-self._sustain_level)/self._release*increment
             while time < end_time_release:
-                yield next(oscillator)*amp
+                yield amp
                 amp += amp_change
                 time += increment
             if amp > 0.0:
-                yield next(oscillator)*amp
-        if not self._stop_at_end:
-            yield from itertools.repeat(0.0)
+                yield amp
+
+    def _envelope_numpy(self) -> Any:
+        # same as _envelope_amplitudes, but vectorized.
+        # the values accumulate exactly like they do in the loops, so the phases have the same lengths and levels.
+        def accumulate(start: float, change: float, length: int) -> Any:
+            values = numpy.full(length, change)
+            values[:1] = start
+            return numpy.cumsum(values)
+
+        end_time_decay = self._attack + self._decay
+        end_time_sustain = end_time_decay + self._sustain
+        end_time_release = end_time_sustain + self._release
+        increment = 1/self.samplerate
+        times = accumulate(0.0, increment, int(end_time_release*self.samplerate)+3)
+        end_attack, end_decay, end_sustain, end_release = \
+            numpy.searchsorted(times, (self._attack, end_time_decay, end_time_sustain, end_time_release))
+        parts = [accumulate(0.0, 1.0/self._attack*increment, end_attack) if self._attack else numpy.zeros(0)]
+        if self._decay:
+            parts.append(accumulate(1.0, (self._sustain_level-1.0)/self._decay*increment, end_decay-end_attack))
+        parts.append(numpy.full(end_sustain-end_decay, self._sustain_level))
+        if self._release:
+            release = accumulate(self._sustain_level, (-self._sustain_level)/self._release*increment, end_release-end_sustain+1)
+            parts.append(release if release[-1] > 0.0 else release[:-1])
+        return numpy.concatenate(parts)
 
 
 class MixingFilter(Filter):
@@ -147,6 +251,7 @@ class MixingFilter(Filter):
     def __init__(self, *sources: Oscillator) -> None:
         super().__init__(sources)
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
         sources = [src.blocks() for src in self.sources]
         source_blocks = itertools.zip_longest(*sources, fillvalue=[0.0]*params.norm_osc_blocksize)
@@ -157,24 +262,37 @@ class MixingFilter(Filter):
         except StopIteration:
             return
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        sources = [src.array_blocks() for src in self.sources]
+        for blocks in itertools.zip_longest(*sources, fillvalue=numpy.zeros(params.norm_osc_blocksize)):
+            length = min(len(block) for block in blocks)
+            yield numpy.add.reduce([block[:length] for block in blocks])
+
 
 class AmpModulationFilter(Filter):
     """Modulate the amplitude of the wave of the oscillator by another oscillator (the modulator)."""
     def __init__(self, source: Oscillator, modulator: Oscillator) -> None:
         assert isinstance(source, Oscillator)
         super().__init__([source])
-        self.modulator = modulator.blocks()
+        self.modulator = modulator
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
         source_blocks = self.sources[0].blocks()
+        modulator = self.modulator.blocks()
         try:
             while True:
                 block = next(source_blocks)
-                amp = next(self.modulator)
+                amp = next(modulator)
                 yield [v*a for (v, a) in zip(block, amp)]
         except StopIteration:
             return
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        for block, amp in zip(self.sources[0].array_blocks(), self.modulator.array_blocks()):
+            length = min(len(block), len(amp))
+            yield block[:length]*amp[:length]
+
 
 class DelayFilter(Filter):
     """
@@ -187,6 +305,7 @@ class DelayFilter(Filter):
         super().__init__([source])
         self._seconds = seconds
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
         blocks = self.sources[0].blocks()
         if self._seconds == 0.0:
@@ -216,6 +335,35 @@ class DelayFilter(Filter):
         except StopIteration:
             yield residue + [0.0] * (params.norm_osc_blocksize-len(residue))
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        blocks = self.sources[0].array_blocks()
+        blocksize = params.norm_osc_blocksize
+        if self._seconds == 0.0:
+            yield from blocks
+            return
+        elif self._seconds > 0.0:
+            amount = int(self.samplerate * self._seconds)
+            while amount >= blocksize:
+                yield numpy.zeros(blocksize)
+                amount -= blocksize
+            if amount == 0:
+                yield from blocks
+                return
+            residue = numpy.zeros(amount)
+        else:
+            amount = -int(self.samplerate * self._seconds)
+            while amount >= blocksize:
+                next(blocks)
+                amount -= blocksize
+            if amount == 0:
+                yield from blocks
+                return
+            residue = next(blocks)[:amount]
+        for sample_block in blocks:
+            yield numpy.concatenate((residue, sample_block[:-len(residue)]))
+            residue = sample_block[-len(residue):]
+        yield numpy.concatenate((residue, numpy.zeros(blocksize-len(residue))))
+
 
 class EchoFilter(Filter):
     """
@@ -235,47 +383,78 @@ class EchoFilter(Filter):
         self._decay = amp_factor
         self.echo_duration = self._after + self._amount*self._delay
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        src = self.single_samples()
-        try:
-            while True:
-                v = list(itertools.islice(src, params.norm_osc_blocksize))
-                if not v:
-                    return
-                yield v
-        except StopIteration:
-            return
-
-    def samples_from_source(self) -> Generator[float, None, None]:
-        try:
-            blks = self.sources[0].blocks()
-            while True:
-                yield from next(blks)
-        except StopIteration:
-            return
+        delays, amps, echos_start, size = self.echo_ring()
+        ring = [0.0] * size
+        write = 0
+        position = 0
+        for block in self.sources[0].blocks():
+            length = len(block)
+            echo_input = block
+            if position < echos_start:
+                silent = min(echos_start-position, length)
+                echo_input = [0.0] * silent + block[silent:]
+            position += length
+            end = write + length
+            if end <= size:
+                ring[write:end] = echo_input
+            else:
+                ring[write:] = echo_input[:size-write]
+                ring[:end-size] = echo_input[size-write:]
+            for delay, amp in zip(delays, amps):
+                start = (write - delay) % size
+                end = start + length
+                echo = ring[start:end] if end <= size else ring[start:] + ring[:end-size]
+                block = [v + amp*e for v, e in zip(block, echo)]
+            write = (write + length) % size
+            yield block
 
-    def single_samples(self) -> Generator[float, None, None]:
-        # first play the first part normally until the echos start
-        source_samples = self.samples_from_source()
-        yield from itertools.islice(source_samples, int(self.samplerate * self._after))
-        # now start mixing the echos
+    def array_blocks(self) -> Generator[Any, None, None]:
+        delays, amps, echos_start, size = self.echo_ring()
+        ring = numpy.zeros(size)
+        steps = numpy.arange(params.norm_osc_blocksize)
+        write = 0
+        position = 0
+        for block in self.sources[0].array_blocks():
+            length = len(block)
+            ring.put(write + steps[:length], block, mode="wrap")
+            if position < echos_start:
+                silent = min(echos_start-position, length)
+                ring.put(write + steps[:silent], 0.0, mode="wrap")
+            position += length
+            mixed = block.copy()
+            for delay, amp in zip(delays, amps):
+                start = (write - delay) % size
+                if start + length <= size:
+                    mixed += amp * ring[start:start+length]
+                else:
+                    mixed += amp * ring.take(start + steps[:length], mode="wrap")
+            write = (write + length) % size
+            yield mixed
+
+    def echo_ring(self) -> Tuple[List[int], List[float], int, int]:
+        """
+        The setup of the ring buffer with the most recent source samples that the echos are mixed from:
+        the delays and amplitudes of the echos, the sample position from where the echos pick up the source
+        (before it, zeros are written into the ring), and the size of the ring. That is large enough that
+        writing a block never overwrites samples that are still to be read.
+        """
+        delays, amps = self.echos()
+        return delays, amps, int(self.samplerate * self._after), max(delays, default=0) + params.norm_osc_blocksize
+
+    def echos(self) -> Tuple[List[int], List[float]]:
+        """The delay (in samples) and amplitude factor of every echo."""
+        delays = []
+        amps = []
         amp = self._decay
-        echo_oscs = [OscillatorFromSingleSamples(src) for src in itertools.tee(source_samples, self._amount+1)]     # type: List[Oscillator]
-        echos = [echo_oscs[0]]
         echo_delay = self._delay
-        for echo in echo_oscs[1:]:
-            echo2 = AmpModulationFilter(DelayFilter(echo, echo_delay), Linear(amp))
-            # @todo sometimes mixing the echos causes pops and clicks. Perhaps solvable by using a (very fast) fadein on the echo osc?
-            echos.append(echo2)
+        for _ in range(self._amount):
+            delays.append(int(self.samplerate * echo_delay))
+            amps.append(amp)
             echo_delay += self._delay
             amp *= self._decay
-        echo_blocks = [echo.blocks() for echo in echos]
-        try:
-            while True:
-                blocks = [next(echoblock) for echoblock in echo_blocks]
-                yield from [sum(x) for x in zip(*blocks)]
-        except StopIteration:
-            return
+        return delays, amps
 
 
 class ClipFilter(Filter):
@@ -286,13 +465,24 @@ class ClipFilter(Filter):
         self.min = minimum
         self.max = maximum
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
+        # optimizations:
+        minimum = self.min
+        maximum = self.max
         try:
             for block in self.sources[0].blocks():
-                yield [max(min(v, self.max), self.min) for v in block]
+                yield [max(min(v, maximum), minimum) for v in block]
         except StopIteration:
             return
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        # optimizations:
+        minimum = self.min
+        maximum = self.max
+        for block in self.sources[0].array_blocks():
+            yield numpy.clip(block, minimum, maximum)
+
 
 class AbsFilter(Filter):
     """Returns the absolute value of the samples from the source oscillator."""
@@ -300,6 +490,7 @@ class AbsFilter(Filter):
         assert isinstance(source, Oscillator)
         super().__init__([source])
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
         try:
             for block in self.sources[0].blocks():
@@ -307,6 +498,10 @@ class AbsFilter(Filter):
         except StopIteration:
             return
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        for block in self.sources[0].array_blocks():
+            yield numpy.abs(block)
+
 
 class NullFilter(Filter):
     """Wraps a single oscillator but does nothing."""
@@ -317,40 +512,69 @@ class NullFilter(Filter):
     def blocks(self) -> Generator[List[float], None, None]:
         return self.sources[0].blocks()
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        return self.sources[0].array_blocks()
+
 
 class Sine(Oscillator):
     """Sine Wave oscillator."""
     def __init__(self, frequency: float, amplitude: float = 1.0, phase: float = 0.0, bias: float = 0.0,
                  fm_lfo: Optional[Oscillator] = None, samplerate: int = 0) -> None:
-        # The FM compensates for the phase change by means of phase_correction.
-        # See http://stackoverflow.com/questions/3089832/sine-wave-glissando-from-one-pitch-to-another-in-numpy
+        # With FM the phase is accumulated per sample from the momentary frequency (phase += freq*increment),
+        # so it stays continuous when the frequency changes. This is equivalent to compensating for the
+        # phase change with a phase correction term, see
+        # http://stackoverflow.com/questions/3089832/sine-wave-glissando-from-one-pitch-to-another-in-numpy
         # and http://stackoverflow.com/questions/28185219/generating-vibrato-sine-wave
-        # The same idea is applied to the other waveforms to correct their phase with FM.
+        # The same idea is applied to the other waveforms to keep their phase continuous with FM.
         super().__init__(samplerate)
         self.frequency = frequency
         self.amplitude = amplitude
         self.bias = bias
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
         self._phase = phase
+        # phase increment per sample for 1 Hz, and the starting phase, in radians
+        self._increment = two_pi/self.samplerate
+        self._phase_rad = phase*two_pi
+        self._with_fm = fm_lfo is not None
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        phase_correction = self._phase*2*pi
-        freq_previous = self.frequency
-        increment = 2.0*pi/self.samplerate
-        t = 0.0
+        phase = self._phase_rad
+        increment = self._increment
         # optimizations:
         frequency = self.frequency
         amplitude = self.amplitude
         bias = self.bias
-        while True:
-            block = []  # type: List[float]
-            fm_block = next(self.fm)
-            for i in range(params.norm_osc_blocksize):
-                freq = frequency*(1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                block.append(sin(t*freq+phase_correction)*amplitude+bias)
-                t += increment
+        sine = fm_sin if self._with_fm else fast_sin
+        fm = self.fm
+        blocksize = params.norm_osc_blocksize
+        if not self._with_fm:
+            ramp = phase_ramp(frequency*increment)
+            block_step = blocksize*frequency*increment
+            while True:
+                yield [sine(phase+offset)*amplitude+bias for offset in ramp]
+                phase = (phase + block_step) % two_pi
+        else:
+            while True:
+                block = []  # type: List[float]
+                append = block.append
+                fm_block = next(fm)
+                for i in range(blocksize):
+                    freq = frequency*(1.0+fm_block[i])
+                    append(sine(phase)*amplitude+bias)
+                    phase += freq*increment
+                phase %= two_pi
+                yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        fm_phases = FmPhases(self.frequency, self._increment, self._phase_rad, two_pi)
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in fm_phases.blocks(self.fm if self._with_fm else None):
+            block = numpy.sin(tt, out=tt)
+            block *= amplitude
+            block += bias
             yield block
 
 
@@ -362,28 +586,50 @@ class Triangle(Oscillator):
         self.frequency = frequency
         self.amplitude = amplitude
         self.bias = bias
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
         self._phase = phase
+        self._with_fm = fm_lfo is not None
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        phase_correction = self._phase
-        freq_previous = self.frequency
+        phase = self._phase
         increment = 1.0/self.samplerate
-        t = 0.0
         # optimizations:
         frequency = self.frequency
         amplitude = self.amplitude
         bias = self.bias
-        while True:
-            block = []  # type: List[float]
-            fm_block = next(self.fm)
-            for i in range(params.norm_osc_blocksize):
-                freq = frequency * (1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                tt = t*freq+phase_correction
-                block.append(4.0*amplitude*(fabs((tt+0.75) % 1.0 - 0.5)-0.25)+bias)
-                t += increment
+        fm = self.fm
+        blocksize = params.norm_osc_blocksize
+        if not self._with_fm:
+            ramp = phase_ramp(frequency*increment)
+            block_step = blocksize*frequency*increment
+            while True:
+                yield [4.0*amplitude*(fabs((phase+offset+0.75) % 1.0 - 0.5)-0.25)+bias for offset in ramp]
+                phase = (phase + block_step) % 1.0
+        else:
+            while True:
+                block = []  # type: List[float]
+                append = block.append
+                fm_block = next(fm)
+                for i in range(blocksize):
+                    freq = frequency * (1.0+fm_block[i])
+                    append(4.0*amplitude*(fabs((phase+0.75) % 1.0 - 0.5)-0.25)+bias)
+                    phase += freq*increment
+                phase %= 1.0
+                yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        fm_phases = FmPhases(self.frequency, 1.0/self.samplerate, self._phase, 1.0)
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in fm_phases.blocks(self.fm if self._with_fm else None):
+            tt += 0.75
+            tt %= 1.0
+            tt -= 0.5
+            block = numpy.abs(tt, out=tt)
+            block *= 4.0*amplitude
+            block += bias-amplitude
             yield block
 
 
@@ -395,29 +641,43 @@ class Square(Oscillator):
         self.frequency = frequency
         self.amplitude = amplitude
         self.bias = bias
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
         self._phase = phase
+        self._with_fm = fm_lfo is not None
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        phase_correction = self._phase
-        freq_previous = self.frequency
+        phase = self._phase
         increment = 1.0/self.samplerate
-        t = 0.0
         # optimizations:
         frequency = self.frequency
-        amplitude = self.amplitude
-        bias = self.bias
-        while True:
-            block = []  # type: List[float]
-            fm_block = next(self.fm)
-            for i in range(params.norm_osc_blocksize):
-                freq = frequency*(1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                tt = t*freq + phase_correction
-                block.append((-amplitude if int(tt*2) % 2 else amplitude)+bias)
-                t += increment
-            yield block
+        # the two output levels, selected by the lowest bit of the half-period count (no branching)
+        levels = (self.amplitude+self.bias, -self.amplitude+self.bias)
+        fm = self.fm
+        blocksize = params.norm_osc_blocksize
+        if not self._with_fm:
+            ramp = phase_ramp(frequency*increment)
+            block_step = blocksize*frequency*increment
+            while True:
+                yield [levels[int((phase+offset)*2) & 1] for offset in ramp]
+                phase = (phase + block_step) % 1.0
+        else:
+            while True:
+                block = []  # type: List[float]
+                append = block.append
+                fm_block = next(fm)
+                for i in range(blocksize):
+                    freq = frequency*(1.0+fm_block[i])
+                    append(levels[int(phase*2) & 1])
+                    phase += freq*increment
+                phase %= 1.0
+                yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        fm_phases = FmPhases(self.frequency, 1.0/self.samplerate, self._phase, 1.0)
+        levels = numpy.array([self.amplitude+self.bias, -self.amplitude+self.bias])
+        for tt in fm_phases.blocks(self.fm if self._with_fm else None):
+            yield levels[(tt*2).astype(numpy.int64) & 1]
 
 
 class Sawtooth(Oscillator):
@@ -428,29 +688,49 @@ class Sawtooth(Oscillator):
         self.frequency = frequency
         self.amplitude = amplitude
         self.bias = bias
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
         self._phase = phase
+        self._with_fm = fm_lfo is not None
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
         increment = 1.0/self.samplerate
-        freq_previous = self.frequency
-        phase_correction = self._phase
-        t = 0.0
+        phase = self._phase
         # optimizations:
         frequency = self.frequency
         amplitude = self.amplitude
         bias = self.bias
-        while True:
-            block = []  # type: List[float]
-            fm_block = next(self.fm)
-            for i in range(params.norm_osc_blocksize):
-                freq = frequency*(1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                tt = t*freq + phase_correction
-                block.append(bias+amplitude*2.0*(tt - floor(0.5+tt)))
-                t += increment
-            yield block
+        fm = self.fm
+        blocksize = params.norm_osc_blocksize
+        if not self._with_fm:
+            ramp = phase_ramp(frequency*increment)
+            block_step = blocksize*frequency*increment
+            while True:
+                yield [bias+amplitude*2.0*(phase+offset - floor(phase+offset+0.5)) for offset in ramp]
+                phase = (phase + block_step) % 1.0
+        else:
+            while True:
+                block = []  # type: List[float]
+                append = block.append
+                fm_block = next(fm)
+                for i in range(blocksize):
+                    freq = frequency*(1.0+fm_block[i])
+                    append(bias+amplitude*2.0*(phase - floor(0.5+phase)))
+                    phase += freq*increment
+                phase %= 1.0
+                yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        fm_phases = FmPhases(self.frequency, 1.0/self.samplerate, self._phase, 1.0)
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in fm_phases.blocks(self.fm if self._with_fm else None):
+            # the (signed) distance to the nearest integer
+            tt -= numpy.floor(tt + 0.5)
+            tt *= 2.0*amplitude
+            tt += bias
+            yield tt
 
 
 class Pulse(Oscillator):
@@ -468,37 +748,121 @@ class Pulse(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
         self.pulsewidth = pulsewidth
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
-        self.pwm = pwm_lfo.blocks() if pwm_lfo else Linear(pulsewidth).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
+        self.pwm = modulation_blocks(pwm_lfo, pulsewidth)
         self._phase = phase
+        self._with_fm = fm_lfo is not None
+        self._with_pwm = pwm_lfo is not None
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
         increment = 1.0/self.samplerate
-        freq_previous = self.frequency
-        phase_correction = self._phase
-        t = 0.0
+        phase = self._phase
         # optimizations:
         frequency = self.frequency
-        amplitude = self.amplitude
-        bias = self.bias
-        while True:
-            block = []  # type: List[float]
-            fm_block = next(self.fm)
-            pwm_block = next_pwm_block(self.pwm)
-            for i in range(params.norm_osc_blocksize):
-                freq = frequency*(1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                tt = t*freq+phase_correction
-                block.append((amplitude if tt % 1.0 < pwm_block[i] else -amplitude)+bias)
-                t += increment
-            yield block
+        high = self.amplitude+self.bias
+        low = -self.amplitude+self.bias
+        fm = self.fm
+        pwm = self.pwm  # type: Iterator[Any]
+        blocksize = params.norm_osc_blocksize
+        if not self._with_fm and not self._with_pwm:
+            yield from self.fixed_pulse().blocks()
+            return
+        if not self._with_pwm:
+            pwm = itertools.repeat([self.clipped_pulsewidth()]*blocksize)
+        if not self._with_fm:
+            ramp = phase_ramp(frequency*increment)
+            block_step = blocksize*frequency*increment
+            while True:
+                pwm_block = next_pwm_block(pwm)
+                yield [high if (phase+offset) % 1.0 < pw else low for offset, pw in zip(ramp, pwm_block)]
+                phase = (phase + block_step) % 1.0
+        else:
+            while True:
+                block = []  # type: List[float]
+                append = block.append
+                fm_block = next(fm)
+                pwm_block = next_pwm_block(pwm) if self._with_pwm else next(pwm)
+                for i in range(blocksize):
+                    freq = frequency*(1.0+fm_block[i])
+                    append(high if phase % 1.0 < pwm_block[i] else low)
+                    phase += freq*increment
+                phase %= 1.0
+                yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        if not self._with_fm and not self._with_pwm:
+            yield from self.fixed_pulse().array_blocks()
+            return
+        fm_phases = FmPhases(self.frequency, 1.0/self.samplerate, self._phase, 1.0)
+        epsilon = sys.float_info.epsilon
+        # optimizations:
+        high = self.amplitude+self.bias
+        low = -self.amplitude+self.bias
+        pulsewidth = self.clipped_pulsewidth()
+        for tt in fm_phases.blocks(self.fm if self._with_fm else None):
+            if self._with_pwm:
+                pulsewidth = numpy.clip(next(self.pwm), epsilon, 1.0-epsilon)
+            tt %= 1.0
+            yield numpy.where(tt < pulsewidth, high, low)
+
+    def clipped_pulsewidth(self) -> float:
+        """The constant pulse width, clipped like the pwm blocks are. This only has to be done once."""
+        epsilon = sys.float_info.epsilon
+        return min(1.0-epsilon, max(epsilon, self.pulsewidth))
+
+    def fixed_pulse(self) -> 'FastPulse':
+        """
+        Without any modulation the waveform is the same as FastPulse's. Its 32 bits phase accumulator
+        needs no modulo per sample, fills whole runs of the same level at once, and gives identical
+        samples in the plain python and the numpy code.
+        """
+        return FastPulse(self.frequency, self.amplitude, self._phase, self.bias, self.pulsewidth,
+                         samplerate=self.samplerate)
+
+
+@functools.lru_cache(maxsize=64)
+def harmonics_wavetable(harmonics: Tuple[Tuple[int, float], ...]) -> List[float]:
+    """
+    Computes a single cycle of the sum of the given harmonics (harmonic number, amplitude).
+    This is cached because it is needed by every note played with the same harmonics.
+    """
+    highest = max([k for k, _ in harmonics], default=1)
+    # the linear interpolation error is at most sum(amp*k*k)*pi*pi/(2*size*size), the size grows
+    # until that is about 16 bit resolution (or the table gets too big for a plain python loop),
+    # but always enough to hold the highest harmonic without aliasing
+    curvature = sum(fabs(amp)*k*k for k, amp in harmonics)*pi*pi/2.0
+    size = 4096
+    while (curvature > size*size/32768 and size < 16384) or size <= 2*highest:
+        size *= 2
+    step = two_pi/size
+    if numpy:
+        # a sum of sines is just the inverse fourier transform of its (imaginary) spectrum
+        spectrum = numpy.zeros(size//2+1, dtype=numpy.complex128)
+        for k, amp in harmonics:
+            spectrum[k] -= 0.5j*size*amp
+        table = numpy.fft.irfft(spectrum, size).tolist()
+    else:
+        table = [0.0]*size
+        for k, amp in harmonics:
+            # sin((i+1)*x) = 2*cos(x)*sin(i*x) - sin((i-1)*x), so no sine per entry is needed
+            factor = 2.0*cos(k*step)
+            previous, current = -amp*sin(k*step), 0.0
+            for i in range(size):
+                table[i] += current
+                previous, current = current, factor*current-previous
+    table.append(table[0])
+    return table
 
 
 class Harmonics(Oscillator):
     """
     Oscillator that produces a waveform based on harmonics.
     This is computationally intensive because many sine waves are added together.
+    Without FM the waveform is periodic, so then a single cycle of it is precomputed
+    in a wavetable once, and the oscillator simply plays that back.
+    With FM the plain python code looks up the same wavetable at the modulated phase,
+    the numpy code computes the exact sum of the harmonics.
     """
     def __init__(self, frequency: float, harmonics: List[Tuple[int, float]], amplitude: float = 1.0, phase: float = 0.0,
                  bias: float = 0.0, fm_lfo: Optional[Oscillator] = None, samplerate: int = 0) -> None:
@@ -506,36 +870,141 @@ class Harmonics(Oscillator):
         self.frequency = frequency
         self.amplitude = amplitude
         self.bias = bias
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
         self._phase = phase
+        # phase increment per sample for 1 Hz, and the starting phase, in radians
+        self._increment = two_pi/self.samplerate
+        self._phase_rad = phase*two_pi
+        self._use_wavetable = fm_lfo is None
         self.harmonics = harmonics
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        increment = 2.0*pi/self.samplerate
-        phase_correction = self._phase*2.0*pi
-        freq_previous = self.frequency
-        t = 0.0
-        # only keep harmonics below the Nyquist frequency
-        harmonics = list(filter(lambda h: h[0] * self.frequency <= self.samplerate / 2, self.harmonics))
+        if self._use_wavetable:
+            yield from self.wavetable_blocks()
+        else:
+            yield from self.fm_blocks()
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        if self._use_wavetable:
+            yield from self.wavetable_array_blocks()
+            return
+        fm_phases = FmPhases(self.frequency, self._increment, self._phase_rad, two_pi)
+        ks, amps = self.harmonics_arrays()
         # optimizations:
-        frequency = self.frequency
         amplitude = self.amplitude
         bias = self.bias
+        if len(ks) and ks.min() >= 0 and ks.max() < 2*len(ks) and numpy.all(ks == numpy.floor(ks)):
+            # dense enough whole harmonics: sum them with the Clenshaw recurrence, which needs only a
+            # single sin and cos per sample instead of one sin per harmonic per sample
+            # (a harmonic that occurs more than once adds up in its coefficient)
+            coefficients = numpy.zeros(int(ks.max())+1)
+            numpy.add.at(coefficients, ks.astype(numpy.intp), amps*amplitude)
+            coefficients = coefficients[:0:-1]
+            while True:
+                phases = fm_phases.next_block(next(self.fm))
+                cosines = 2.0*numpy.cos(phases)
+                b1 = numpy.zeros(len(phases))
+                b2 = numpy.zeros(len(phases))
+                for c in coefficients:
+                    b1, b2 = cosines*b1-b2, b1
+                    b1 += c
+                b1 *= numpy.sin(phases, out=phases)
+                b1 += bias
+                yield b1
+        amps = amps*amplitude
+        while True:
+            phases = fm_phases.next_block(next(self.fm))
+            # all harmonics of all samples at once, summed by a single matrix-vector product
+            block = numpy.sin(numpy.outer(phases, ks)) @ amps
+            block += bias
+            yield block
+
+    def fm_blocks(self) -> Generator[List[float], None, None]:
+        # the sum of the harmonics only depends on the phase, so it can be interpolated from the
+        # wavetable at the modulated phase, instead of computing a sine per harmonic per sample
+        table = self.scaled_wavetable()
+        size = len(table)-1
+        position = self._phase % 1.0 * size
+        increment = size/self.samplerate
+        # optimizations:
+        frequency = self.frequency
+        fm = self.fm
+        blocksize = params.norm_osc_blocksize
         while True:
             block = []  # type: List[float]
-            fm_block = next(self.fm)
-            for i in range(params.norm_osc_blocksize):
-                h = 0.0
-                freq = frequency*(1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                q = t*freq + phase_correction
-                for k, amp in harmonics:
-                    h += sin(q*k)*amp
-                block.append(h*amplitude+bias)
-                t += increment
+            append = block.append
+            fm_block = next(fm)
+            for i in range(blocksize):
+                j = int(position)
+                v = table[j]
+                append(v+(table[j+1]-v)*(position-j))
+                position += frequency*(1.0+fm_block[i])*increment
+                if not 0.0 <= position < size:
+                    position %= size
+            yield block
+
+    def wavetable_array_blocks(self) -> Generator[Any, None, None]:
+        table = numpy.array(self.scaled_wavetable())
+        size = len(table)-1
+        position = self._phase % 1.0 * size
+        increment = self.frequency*size/self.samplerate
+        steps = numpy.arange(params.norm_osc_blocksize) * increment
+        while True:
+            positions = position + steps
+            positions %= size
+            indexes = positions.astype(numpy.intp)
+            values = table[indexes]
+            positions -= indexes
+            positions *= table[indexes+1]-values
+            values += positions
+            yield values
+            position = (position + params.norm_osc_blocksize*increment) % size
+
+    def wavetable_blocks(self) -> Generator[List[float], None, None]:
+        table = self.scaled_wavetable()
+        size = len(table)-1
+        position = self._phase % 1.0 * size
+        increment = self.frequency*size/self.samplerate
+        while True:
+            block = []  # type: List[float]
+            for _ in range(params.norm_osc_blocksize):
+                i = int(position)
+                v = table[i]
+                block.append(v+(table[i+1]-v)*(position-i))
+                position += increment
+                if position >= size:
+                    position -= size
             yield block
 
+    def scaled_wavetable(self) -> List[float]:
+        """
+        The wavetable with the amplitude and bias applied. The interpolation is linear,
+        so the table can be scaled beforehand instead of every sample.
+        """
+        amplitude = self.amplitude
+        bias = self.bias
+        return [v*amplitude+bias for v in self.wavetable()]
+
+    def audible_harmonics(self) -> List[Tuple[int, float]]:
+        # only keep harmonics below the Nyquist frequency
+        return list(filter(lambda h: h[0] * self.frequency <= self.samplerate / 2, self.harmonics))
+
+    def harmonics_arrays(self) -> Tuple[Any, Any]:
+        """The audible harmonics as two numpy arrays: the harmonic numbers and their amplitudes."""
+        harmonics = self.audible_harmonics()
+        ks = numpy.array([k for k, _ in harmonics], dtype=numpy.float64)
+        amps = numpy.array([amp for _, amp in harmonics], dtype=numpy.float64)
+        return ks, amps
+
+    def wavetable(self) -> List[float]:
+        """
+        A single cycle of the (unscaled) waveform, for playback with linear interpolation.
+        The table is one entry longer than the cycle itself, the last entry wraps around to the first.
+        It is shared between all oscillators with the same harmonics, so it must not be modified.
+        """
+        return harmonics_wavetable(tuple(self.audible_harmonics()))
+
 
 class SquareH(Harmonics):
     """
@@ -560,13 +1029,20 @@ class SawtoothH(Harmonics):
         harmonics = [(n, 1.0/n) for n in range(1, num_harmonics+1)]  # all harmonics
         super().__init__(frequency, harmonics, amplitude, phase+0.5, bias, fm_lfo=fm_lfo, samplerate=samplerate)
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
+        offset = self.bias*2.0
         try:
             for block in super().blocks():
-                yield [self.bias*2.0-y for y in block]
+                yield [offset-y for y in block]
         except StopIteration:
             return
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        offset = self.bias*2.0
+        for block in super().array_blocks():
+            yield numpy.subtract(offset, block, out=block)
+
 
 class WhiteNoise(Oscillator):
     """Oscillator that produces white noise (randomness) waveform."""
@@ -576,27 +1052,65 @@ class WhiteNoise(Oscillator):
         self.bias = bias
         self.frequency = frequency
 
-    def random_values(self) -> Generator[float, None, None]:
+    def hold_cycles(self) -> int:
+        """The number of samples every random value is held, also across blocks."""
         cycles = int(self.samplerate / self.frequency)
         if cycles < 1:
             raise ValueError("whitenoise frequency cannot be bigger than the sample rate")
+        return cycles
+
+    def random_values(self) -> Generator[float, None, None]:
+        cycles = self.hold_cycles()
         # optimizations:
         amplitude = self.amplitude
         bias = self.bias
         while True:
             value = random.uniform(-amplitude, amplitude) + bias
-            yield from [value] * cycles
+            yield from itertools.repeat(value, cycles)
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        cycles = int(self.samplerate / self.frequency)
-        if cycles < 1:
-            raise ValueError("whitenoise frequency cannot be bigger than the sample rate")
-        values = self.random_values()
+        cycles = self.hold_cycles()
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        uniform = random.uniform
+        repeat = itertools.repeat
+        blocksize = params.norm_osc_blocksize
+        value = 0.0
+        remaining = 0
         while True:
-            v = list(itertools.islice(values, params.norm_osc_blocksize))
-            if not v:
-                return
-            yield v
+            block = []      # type: List[float]
+            todo = blocksize
+            while todo:
+                if not remaining:
+                    value = uniform(-amplitude, amplitude) + bias
+                    remaining = cycles
+                count = min(remaining, todo)
+                block.extend(repeat(value, count))
+                remaining -= count
+                todo -= count
+            yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        cycles = self.hold_cycles()
+        # seeded from the random module, so random.seed() still makes the noise reproducible
+        rng = numpy.random.default_rng(random.getrandbits(64))
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        blocksize = params.norm_osc_blocksize
+        buffersize = 16*blocksize
+        samples = numpy.empty(0)
+        while True:
+            if len(samples) < blocksize:
+                # refill the buffer for a number of blocks at once, with a single call to the generator
+                count = -(-(buffersize - len(samples)) // cycles)
+                values = rng.uniform(-amplitude, amplitude, count)
+                values += bias
+                samples = numpy.concatenate((samples, numpy.repeat(values, cycles)))
+            yield samples[:blocksize]
+            samples = samples[blocksize:]
 
 
 class Linear(Oscillator):
@@ -622,10 +1136,12 @@ class Linear(Oscillator):
                     block.append(value)
                     value = min(maxv, max(minv, value+incr))
                 yield block
-        else:
-            block = [value] * params.norm_osc_blocksize
-            while True:
-                yield list(block)
+                if min(maxv, max(minv, value+incr)) == value:
+                    # reached the maximum or minimum, from now on the value stays the same
+                    break
+        block = [value] * params.norm_osc_blocksize
+        while True:
+            yield list(block)
 
 
 class Semicircle(Oscillator):
@@ -637,28 +1153,44 @@ class Semicircle(Oscillator):
         self.frequency = frequency
         self.amplitude = amplitude
         self.bias = bias
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
+        self._with_fm = fm_lfo is not None
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        phase_correction = self._phase * 2.0
-        freq_previous = self.frequency
+        phase = self._phase * 2.0 - self.frequency
         increment = 2.0/self.samplerate
-        t = -1.0
         # optimizations:
         amplitude = self.amplitude
         bias = self.bias
         frequency = self.frequency
+        fm = self.fm
+        blocksize = params.norm_osc_blocksize
         while True:
             block = []  # type: List[float]
-            fm_block = next(self.fm)
-            for i in range(params.norm_osc_blocksize):
+            append = block.append
+            fm_block = next(fm)
+            for i in range(blocksize):
                 freq = frequency*(1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                ft = t*freq + phase_correction
-                ft = (ft % 2.0) - 1.0
-                block.append(sqrt(1.0 - ft*ft) * amplitude + bias)
-                t += increment
+                ft = (phase % 2.0) - 1.0
+                append(sqrt(1.0 - ft*ft) * amplitude + bias)
+                phase += freq*increment
+            phase %= 2.0
+            yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        fm_phases = FmPhases(self.frequency, 2.0/self.samplerate, self._phase*2.0 - self.frequency, 2.0)
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in fm_phases.blocks(self.fm if self._with_fm else None):
+            tt %= 2.0
+            tt -= 1.0
+            tt *= tt
+            block = numpy.subtract(1.0, tt, out=tt)
+            numpy.sqrt(block, out=block)
+            block *= amplitude
+            block += bias
             yield block
 
 
@@ -670,35 +1202,44 @@ class Pointy(Oscillator):
         self.frequency = frequency
         self.amplitude = amplitude
         self.bias = bias
-        self.fm = fm_lfo.blocks() if fm_lfo else Linear(0.0).blocks()
+        self.fm = modulation_blocks(fm_lfo, 0.0)
+        self._with_fm = fm_lfo is not None
         self._phase = phase
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        two_pi = 2*pi
-        phase_correction = self._phase*two_pi
-        freq_previous = self.frequency
+        phase = self._phase*two_pi
         increment = two_pi/self.samplerate
-        t = 0.0
         # optimizations:
+        period = two_pi
         amplitude = self.amplitude
         bias = self.bias
         frequency = self.frequency
+        fm = self.fm
+        blocksize = params.norm_osc_blocksize
         while True:
-            block = []
-            fm_block = next(self.fm)
-            for i in range(params.norm_osc_blocksize):
+            block = []  # type: List[float]
+            append = block.append
+            fm_block = next(fm)
+            for i in range(blocksize):
                 freq = frequency*(1.0+fm_block[i])
-                phase_correction += (freq_previous-freq)*t
-                freq_previous = freq
-                tt = t*freq + phase_correction
-                vv = 1.0-abs(cos(tt))
-                if tt % two_pi > pi:
-                    block.append(-vv*vv*amplitude+bias)
+                vv = 1.0-abs(cos(phase))
+                if phase % period > pi:
+                    append(-vv*vv*amplitude+bias)
                 else:
-                    block.append(vv*vv*amplitude+bias)
-                t += increment
+                    append(vv*vv*amplitude+bias)
+                phase += freq*increment
+            phase %= period
             yield block
 
+    def array_blocks(self) -> Generator[Any, None, None]:
+        fm_phases = FmPhases(self.frequency, two_pi/self.samplerate, self._phase*two_pi, two_pi)
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in fm_phases.blocks(self.fm if self._with_fm else None):
+            yield pointy_wave(tt, amplitude, bias)
+
 
 class FastSine(Oscillator):
     """Fast sine wave oscillator. Some parameters cannot be changed."""
@@ -710,18 +1251,36 @@ class FastSine(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
         rate = self.samplerate / self._frequency
-        increment = 2.0*pi/rate
-        t = self._phase*2.0*pi
+        increment = two_pi/rate
+        t = self._phase*two_pi
         # optimizations:
         amplitude = self.amplitude
         bias = self.bias
+        blocksize = params.norm_osc_blocksize
+        # successive (scaled) sine values follow the recurrence s[n+1] = 2*cos(increment)*s[n] - s[n-1],
+        # so no sin() is needed per sample. It is seeded with the exact values at the start of every block.
+        k = 2.0*cos(increment)
         while True:
-            block = []
-            for _ in range(params.norm_osc_blocksize):
-                block.append(sin(t)*amplitude+bias)
-                t += increment
+            s0 = sin(t-increment)*amplitude
+            s1 = sin(t)*amplitude
+            block = [0.0]*blocksize
+            for i in range(blocksize):
+                block[i] = s1+bias
+                s0, s1 = s1, k*s1-s0
+            t = (t + blocksize*increment) % two_pi
+            yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in FmPhases(self._frequency, two_pi/self.samplerate, self._phase*two_pi, two_pi).blocks(None):
+            block = numpy.sin(tt)
+            block *= amplitude
+            block += bias
             yield block
 
 
@@ -735,18 +1294,38 @@ class FastTriangle(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        freq = self._frequency
-        t = self._phase/freq
-        increment = 1.0/self.samplerate
+        yield from self.loop_blocks(triangle_loop, lambda size: [0.0]*size)
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        if numba:
+            yield from self.loop_blocks(compiled_triangle_loop, numpy.empty)
         # optimizations:
         amplitude = self.amplitude
         bias = self.bias
+        for tt in FmPhases(self._frequency, 1.0/self.samplerate, self._phase, 1.0).blocks(None):
+            tt += 0.75
+            tt %= 1.0
+            tt -= 0.5
+            block = numpy.abs(tt, out=tt)
+            block *= 4.0*amplitude
+            block += bias-amplitude
+            yield block
+
+    def loop_blocks(self, loop: Callable[..., float], new_block: Callable[[int], Any]) -> Generator[Any, None, None]:
+        """The blocks (made by new_block) filled by the given plain or compiled triangle_loop."""
+        # a fractional phase in [0, 1) that is kept in range by a single subtraction,
+        # instead of taking a modulo per sample (frequencies above the sample rate alias anyway)
+        phase = (self._phase+0.75) % 1.0
+        increment = self._frequency/self.samplerate % 1.0
+        # optimizations:
+        scale = 4.0*self.amplitude
+        bias = self.bias
+        blocksize = params.norm_osc_blocksize
         while True:
-            block = []
-            for _ in range(params.norm_osc_blocksize):
-                block.append(4.0*amplitude*(fabs((t*freq+0.75) % 1.0 - 0.5)-0.25)+bias)
-                t += increment
+            block = new_block(blocksize)
+            phase = loop(block, phase, increment, scale, bias)
             yield block
 
 
@@ -760,19 +1339,23 @@ class FastSquare(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        freq = self._frequency
-        t = self._phase/freq
-        increment = 1.0/self.samplerate
-        # optimizations:
-        amplitude = self.amplitude
-        bias = self.bias
+        phase, increment = nco_phase(self._phase, self._frequency, self.samplerate)
+        yield from nco_pulse_blocks(phase, increment, 0x80000000, self.amplitude+self.bias, -self.amplitude+self.bias)
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        phase, increment = nco_phase(self._phase, self._frequency, self.samplerate)
+        levels = numpy.array([self.amplitude+self.bias, -self.amplitude+self.bias])
+        blocksize = params.norm_osc_blocksize
+        # uint32 arithmetic wraps around by itself, just like the masked accumulator of the pure python
+        # loop, so both give identical samples
+        steps = numpy.arange(blocksize, dtype=numpy.uint32) * numpy.uint32(increment)
         while True:
-            block = []  # type: List[float]
-            for _ in range(params.norm_osc_blocksize):
-                block.append((-amplitude if int(t*freq*2) % 2 else amplitude)+bias)
-                t += increment
-            yield block
+            phases = steps + numpy.uint32(phase)
+            phases >>= 31
+            yield levels[phases]
+            phase = (phase + blocksize*increment) & 0xffffffff
 
 
 class FastSawtooth(Oscillator):
@@ -785,20 +1368,34 @@ class FastSawtooth(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        freq = self._frequency
-        t = self._phase/freq
-        increment = 1.0/self.samplerate
+        # the accumulator runs half a period ahead, so the sawtooth is a linear function of it
+        phase, increment = nco_phase(self._phase+0.5, self._frequency, self.samplerate)
         # optimizations:
-        amplitude = self.amplitude
-        bias = self.bias
+        scale = self.amplitude/0x80000000
+        offset = self.bias-self.amplitude
+        blocksize = params.norm_osc_blocksize
         while True:
-            block = []  # type: List[float]
-            for _ in range(params.norm_osc_blocksize):
-                tt = t*freq
-                block.append(bias+2.0*amplitude*(tt - floor(0.5+tt)))
-                t += increment
+            block = [0.0]*blocksize
+            for i in range(blocksize):
+                block[i] = phase*scale+offset
+                phase = (phase + increment) & 0xffffffff
+            yield block
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        # the same accumulator as the pure python loop, in uint32 arithmetic that wraps around by itself
+        phase, increment = nco_phase(self._phase+0.5, self._frequency, self.samplerate)
+        # optimizations:
+        scale = self.amplitude/0x80000000
+        offset = self.bias-self.amplitude
+        blocksize = params.norm_osc_blocksize
+        steps = numpy.arange(blocksize, dtype=numpy.uint32) * numpy.uint32(increment)
+        while True:
+            block = (steps + numpy.uint32(phase)) * scale
+            block += offset
             yield block
+            phase = (phase + blocksize*increment) & 0xffffffff
 
 
 class FastPulse(Oscillator):
@@ -820,37 +1417,326 @@ class FastPulse(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
+        phase, increment = nco_phase(self._phase, self._frequency, self.samplerate)
         # optimizations:
-        amplitude = self.amplitude
-        frequency = self._frequency
-        bias = self.bias
+        high = self.amplitude+self.bias
+        low = -self.amplitude+self.bias
+        blocksize = params.norm_osc_blocksize
         if self._pwm:
             # loop without FM, but with PWM
             pwm = self._pwm.blocks()
-            t = self._phase/self._frequency
-            increment = 1.0/self.samplerate
             while True:
-                block = []  # type: List[float]
+                block = [0.0]*blocksize
                 pwm_block = next_pwm_block(pwm)
-                for i in range(params.norm_osc_blocksize):
-                    block.append((amplitude if t*frequency % 1.0 < pwm_block[i] else -amplitude)+bias)
-                    t += increment
+                for i in range(blocksize):
+                    block[i] = high if phase < pwm_block[i]*4294967296.0 else low
+                    phase = (phase + increment) & 0xffffffff
                 yield block
         else:
             # no FM, no PWM
-            pulsewidth = self._pulsewidth
-            t = self._phase/self._frequency
-            increment = 1.0/self.samplerate
-            while True:
-                block = []
-                for _ in range(params.norm_osc_blocksize):
-                    block.append((amplitude if t*frequency % 1.0 < pulsewidth else -amplitude)+bias)
-                    t += increment
+            yield from nco_pulse_blocks(phase, increment, int(self._pulsewidth*4294967296.0), high, low)
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        # the same accumulator and threshold as the pure python loop, in uint32 arithmetic
+        phase, increment = nco_phase(self._phase, self._frequency, self.samplerate)
+        # optimizations:
+        high = self.amplitude+self.bias
+        low = -self.amplitude+self.bias
+        blocksize = params.norm_osc_blocksize
+        if self._pwm and numba:
+            for pwm_block in self._pwm.array_blocks():
+                block = numpy.empty(len(pwm_block))
+                phase = pwm_pulse_loop(numpy.asarray(pwm_block, dtype=numpy.float64), block,
+                                       phase, increment, high, low)
                 yield block
+            return
+        steps = numpy.arange(blocksize, dtype=numpy.uint32) * numpy.uint32(increment)
+        if self._pwm:
+            epsilon = sys.float_info.epsilon
+            for pwm_block in self._pwm.array_blocks():
+                phases = steps[:len(pwm_block)] + numpy.uint32(phase)
+                pulsewidths = numpy.clip(pwm_block, epsilon, 1.0-epsilon)
+                pulsewidths *= 4294967296.0
+                yield numpy.where(phases < pulsewidths, high, low)
+                phase = (phase + len(pwm_block)*increment) & 0xffffffff
+            return
+        pulsewidth = int(self._pulsewidth*4294967296.0)
+        while True:
+            phases = steps + numpy.uint32(phase)
+            yield numpy.where(phases < pulsewidth, high, low)
+            phase = (phase + blocksize*increment) & 0xffffffff
+
+
+# quarter period sine lookup table, used by lut_sin()
+sine_lut_size = 4096    # must be a power of two
+sine_lut = array.array('d', [sin(i*pi/2/sine_lut_size) for i in range(sine_lut_size+1)])
+
+
+def lut_sin(x: float) -> float:
+    """
+    Approximates sin(x) using the quarter period sine lookup table,
+    mirrored into the other quadrants, and linear interpolation between the table entries.
+    """
+    x = x * (sine_lut_size*2/pi) % (4*sine_lut_size)
+    i = int(x)
+    frac = x - i
+    quadrant = i // sine_lut_size
+    idx = i & (sine_lut_size-1)
+    if quadrant & 1:
+        v1 = sine_lut[sine_lut_size-idx]
+        v2 = sine_lut[sine_lut_size-idx-1]
+    else:
+        v1 = sine_lut[idx]
+        v2 = sine_lut[idx+1]
+    v = v1 + (v2-v1)*frac
+    return -v if quadrant & 2 else v
+
+
+def pade_sin(x: float) -> float:
+    """
+    Approximates sin(x) with a Pade approximant, after reducing x to the range -pi...pi.
+    The error is around 1e-5 over the whole range and, unlike the lookup table,
+    it doesn't step through table entries when the frequency is swept by FM.
+    """
+    x -= two_pi*floor(x*inv_two_pi+0.5)
+    x2 = x*x
+    return x*(11511339840.0 - x2*(1640635920.0 - x2*(52785432.0 - x2*479249.0))) / \
+        (11511339840.0 + x2*(277920720.0 + x2*(3177720.0 + x2*18361.0)))
+
+
+# The plain python Sine loops use the approximations on Pypy, where the jitted
+# code is faster than calling into libm: the lookup table without FM, the Pade approximant with FM.
+# On CPython the builtin math.sin is faster than both.
+fast_sin = lut_sin if running_on_pypy else sin
+fm_sin = pade_sin if running_on_pypy else sin
+
+
+def fm_phases_loop(fm_block: Any, phases: Any, frequency: float, increment: float, phase: float) -> float:
+    """
+    The per-sample FM phase accumulation loop of the oscillators, for numpy arrays.
+    Fills the phases array and returns the phase following the block.
+    It is only used when it can be compiled with numba (see below).
+    """
+    for i in range(len(fm_block)):
+        phases[i] = phase
+        phase += frequency*(1.0+fm_block[i])*increment
+    return phase
+
+
+def pwm_pulse_loop(pwm_block: Any, block: Any, phase: int, increment: int, high: float, low: float) -> int:
+    """
+    The per-sample loop of FastPulse with pulse width modulation, for numpy arrays.
+    Fills the block with the high level while the 32 bits phase accumulator (see nco_phase) is below
+    the pulse width of the pwm block (clipped between 0 and 1), the low level otherwise, exactly like
+    the pure python loop. Returns the accumulator following the block.
+    It is only used when it can be compiled with numba (see below).
+    """
+    epsilon = 2.220446049250313e-16     # sys.float_info.epsilon
+    for i in range(len(pwm_block)):
+        pulsewidth = min(1.0-epsilon, max(epsilon, pwm_block[i]))
+        block[i] = high if phase < pulsewidth*4294967296.0 else low
+        phase = (phase + increment) & 0xffffffff
+    return phase
+
+
+def triangle_loop(block: Any, phase: float, increment: float, scale: float, bias: float) -> float:
+    """
+    The per-sample loop of FastTriangle. Fills the block (a list or numpy array) and returns
+    the phase following it. The phase is a fraction in [0, 1) and the increment must be below 1.
+    """
+    for i in range(len(block)):
+        block[i] = scale*(fabs(phase-0.5)-0.25)+bias
+        phase += increment
+        if phase >= 1.0:
+            phase -= 1.0
+    return phase
+
+
+def semicircle_loop(block: Any, t: float, increment: float, amplitude: float, bias: float) -> float:
+    """
+    The per-sample loop of FastSemicircle. Fills the block (a list or numpy array) and returns
+    the position following it. The position is in [-1, 1) and the increment must be below 2.
+    """
+    for i in range(len(block)):
+        block[i] = sqrt(1.0 - t*t) * amplitude + bias
+        t += increment
+        if t >= 1.0:
+            t -= 2.0
+    return t
+
+
+def pointy_loop(block: Any, t: float, increment: float, amplitude: float, bias: float) -> float:
+    """
+    The per-sample loop of FastPointy. Fills the block (a list or numpy array) and returns
+    the phase following it. The phase is in [0, 2*pi) and the increment must be below 2*pi.
+    """
+    period = two_pi
+    half_period = pi
+    for i in range(len(block)):
+        vv = 1.0-fabs(cos(t))
+        vv *= vv*amplitude
+        block[i] = bias-vv if t > half_period else bias+vv
+        t += increment
+        if t >= period:
+            t -= period
+    return t
+
+
+if numba:
+    # compiled versions of the per-sample loops, these run a lot faster than the equivalent numpy expressions.
+    # They release the GIL, so that other threads (such as the audio output thread) can run meanwhile.
+    compile_loop = numba.njit(cache=True, fastmath=True, nogil=True)
+    fm_phases_loop = compile_loop(fm_phases_loop)
+    pwm_pulse_loop = compile_loop(pwm_pulse_loop)
+    # the waveform loops also fill the lists of the pure python code, so those keep the plain functions
+    compiled_triangle_loop = compile_loop(triangle_loop)
+    compiled_semicircle_loop = compile_loop(semicircle_loop)
+    compiled_pointy_loop = compile_loop(pointy_loop)
+
+
+class FmPhases:
+    """
+    Vectorized version of the FM phase accumulation that the oscillators do per sample
+    in their blocks() loop: computes the phase values for a whole block of FM values at once,
+    as a cumulative sum of the momentary frequencies. The sum starts from the phase and runs in
+    the same order as the loop, so the phases are identical and the waveforms don't differ at the
+    edges of a period. The phase is kept within a single period so it doesn't lose precision over
+    long durations.
+    If numba is available this uses the compiled fm_phases_loop instead. (requires numpy)
+    Every block of phases is a new array, so the oscillators compute their samples in place in it.
+    """
+    def __init__(self, frequency: float, increment: float, phase: float, period: float) -> None:
+        self.frequency = frequency
+        self.increment = increment
+        self.phase = phase
+        self.period = period
+
+    def next_block(self, fm_block: Sequence[float]) -> Any:
+        if numba:
+            phases = numpy.empty(len(fm_block))
+            phase = fm_phases_loop(numpy.asarray(fm_block, dtype=numpy.float64), phases,
+                                   self.frequency, self.increment, self.phase)
+            self.phase = phase % self.period
+            return phases
+        steps = self.frequency * (1.0 + numpy.asarray(fm_block))
+        steps *= self.increment
+        phases = numpy.empty_like(steps)
+        phases[0] = self.phase
+        phases[1:] = steps[:-1]
+        numpy.add.accumulate(phases, out=phases)
+        self.phase = (phases[-1] + steps[-1]) % self.period
+        return phases
+
+    def blocks(self, fm: Optional[Iterator[Any]]) -> Generator[Any, None, None]:
+        """
+        The phases for every block of FM values from the given fm blocks generator.
+        Without FM, the phases simply advance with the constant frequency.
+        """
+        if fm:
+            for fm_block in fm:
+                yield self.next_block(fm_block)
+        else:
+            step = self.frequency*self.increment
+            steps = numpy.array(phase_ramp(step))
+            block_step = params.norm_osc_blocksize*step
+            while True:
+                yield self.phase + steps
+                self.phase = (self.phase + block_step) % self.period
+
+
+def phase_ramp(step: float) -> List[float]:
+    """
+    The phase offsets of the samples in a block at a constant frequency, relative to the first one.
+    Without FM the oscillators add these to the phase at the start of every block, in the python
+    loops as well as in FmPhases, so both produce the same samples, and the rounding errors
+    don't accumulate within the block.
+    """
+    return [i*step for i in range(params.norm_osc_blocksize)]
+
+
+def modulation_blocks(lfo: Optional[Oscillator], default: float) -> Generator[Any, None, None]:
+    """
+    The blocks of a modulating LFO (such as the FM or PWM of an oscillator).
+    If numpy is available these are the numpy array blocks, so the modulated oscillator
+    can use them in its vectorized array_blocks() directly. Otherwise they are the regular blocks.
+    Without an LFO, the blocks simply consist of the constant default value.
+    """
+    if not numpy:
+        yield from (lfo or Linear(default)).blocks()
+    elif lfo:
+        yield from lfo.array_blocks()
+    else:
+        block = numpy.full(params.norm_osc_blocksize, default)
+        while True:
+            yield block
+
+
+def pointy_wave(phases: Any, amplitude: float, bias: float) -> Any:
+    """The pointy waveform for a numpy array of phases (in radians)."""
+    vv = 1.0-numpy.abs(numpy.cos(phases))
+    vv *= vv
+    vv *= numpy.where(phases % two_pi > pi, -amplitude, amplitude)
+    vv += bias
+    return vv
+
+
+def nco_phase(phase: float, frequency: float, samplerate: int) -> Tuple[int, int]:
+    """
+    The starting value and the increment per sample of a 32 bits integer phase accumulator
+    (as used in a numerically controlled oscillator) for the given phase and frequency.
+    A full period corresponds to 2**32, so the accumulator simply wraps around by masking it.
+    """
+    return int(phase % 1.0 * 4294967296.0) & 0xffffffff, int(round(frequency/samplerate*4294967296.0)) & 0xffffffff
+
+
+def nco_pulse_block(phase: int, increment: int, threshold: int, high: float, low: float,
+                    size: int) -> Tuple[List[float], int]:
+    """
+    A block of a pulse wave driven by a 32 bits phase accumulator (see nco_phase): the high level
+    while the accumulator is below the threshold, the low level otherwise. Instead of stepping
+    through every sample, it computes how many samples every level lasts, so the work only depends
+    on the number of edges in the block. Returns the block and the accumulator following it.
+    """
+    if not increment:
+        return [high if phase < threshold else low] * size, phase
+    block = []  # type: List[float]
+    extend = block.extend
+    repeat = itertools.repeat
+    while size:
+        if phase < threshold:
+            count = min(size, (threshold-phase-1) // increment + 1)
+            extend(repeat(high, count))
+        else:
+            count = min(size, (0xffffffff-phase) // increment + 1)
+            extend(repeat(low, count))
+        phase = (phase + count*increment) & 0xffffffff
+        size -= count
+    return block, phase
+
+
+def nco_pulse_blocks(phase: int, increment: int, threshold: int,
+                     high: float, low: float) -> Generator[List[float], None, None]:
+    """
+    The endless blocks of a pulse wave driven by a 32 bits phase accumulator (see nco_pulse_block).
+    Below 1/32 of the sample rate the levels last long enough to fill the blocks by whole runs,
+    above that it is faster to just step through every sample.
+    """
+    blocksize = params.norm_osc_blocksize
+    if increment < 0x8000000:
+        while True:
+            block, phase = nco_pulse_block(phase, increment, threshold, high, low, blocksize)
+            yield block
+    while True:
+        block = [0.0]*blocksize
+        for i in range(blocksize):
+            block[i] = high if phase < threshold else low
+            phase = (phase + increment) & 0xffffffff
+        yield block
 
 
-def next_pwm_block(pwm: Generator[List[float], None, None]) -> List[float]:
+def next_pwm_block(pwm: Iterator[Any]) -> List[float]:
     epsilon = sys.float_info.epsilon
     pwm_block = next(pwm)
     return [min(1.0-epsilon, max(epsilon, p)) for p in pwm_block]
@@ -866,20 +1752,37 @@ class FastSemicircle(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        rate = self.samplerate / self._frequency
-        increment = 2.0/rate
-        t = -1.0 + self._phase * 2
+        yield from self.loop_blocks(semicircle_loop, lambda size: [0.0]*size)
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        if numba:
+            yield from self.loop_blocks(compiled_semicircle_loop, numpy.empty)
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in FmPhases(self._frequency, 2.0/self.samplerate, self._phase*2.0, 2.0).blocks(None):
+            tt %= 2.0
+            tt -= 1.0
+            tt *= tt
+            block = numpy.subtract(1.0, tt, out=tt)
+            numpy.sqrt(block, out=block)
+            block *= amplitude
+            block += bias
+            yield block
+
+    def loop_blocks(self, loop: Callable[..., float], new_block: Callable[[int], Any]) -> Generator[Any, None, None]:
+        """The blocks (made by new_block) filled by the given plain or compiled semicircle_loop."""
+        t = (self._phase * 2) % 2.0 - 1.0
+        increment = 2.0*self._frequency/self.samplerate % 2.0
         # optimizations:
         amplitude = self.amplitude
         bias = self.bias
+        blocksize = params.norm_osc_blocksize
         while True:
-            block = []  # type: List[float]
-            for _ in range(params.norm_osc_blocksize):
-                block.append(sqrt(1.0 - t*t) * amplitude + bias)
-                t += increment
-                if t >= 1.0:
-                    t -= 2.0
+            block = new_block(blocksize)
+            t = loop(block, t, increment, amplitude, bias)
             yield block
 
 
@@ -893,24 +1796,30 @@ class FastPointy(Oscillator):
         self.amplitude = amplitude
         self.bias = bias
 
+    @vectorized_blocks
     def blocks(self) -> Generator[List[float], None, None]:
-        rate = self.samplerate / self._frequency
-        two_pi = 2.0*pi
-        increment = two_pi/rate
-        t = self._phase*two_pi
+        yield from self.loop_blocks(pointy_loop, lambda size: [0.0]*size)
+
+    def array_blocks(self) -> Generator[Any, None, None]:
+        if numba:
+            yield from self.loop_blocks(compiled_pointy_loop, numpy.empty)
+        # optimizations:
+        amplitude = self.amplitude
+        bias = self.bias
+        for tt in FmPhases(self._frequency, two_pi/self.samplerate, self._phase*two_pi, two_pi).blocks(None):
+            yield pointy_wave(tt, amplitude, bias)
+
+    def loop_blocks(self, loop: Callable[..., float], new_block: Callable[[int], Any]) -> Generator[Any, None, None]:
+        """The blocks (made by new_block) filled by the given plain or compiled pointy_loop."""
+        t = self._phase % 1.0 * two_pi
+        increment = two_pi*self._frequency/self.samplerate % two_pi
         # optimizations:
         amplitude = self.amplitude
         bias = self.bias
+        blocksize = params.norm_osc_blocksize
         while True:
-            block = []  # type: List[float]
-            for _ in range(params.norm_osc_blocksize):
-                t %= two_pi
-                vv = 1.0-abs(cos(t))
-                if t > pi:
-                    block.append(-vv*vv*amplitude+bias)
-                else:
-                    block.append(vv*vv*amplitude+bias)
-                t += increment
+            block = new_block(blocksize)
+            t = loop(block, t, increment, amplitude, bias)
             yield block
 
 
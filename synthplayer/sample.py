@@ -13,6 +13,7 @@ import math
 import itertools
 from typing import Callable, Generator, Iterable, Any, Tuple, Union, Optional, BinaryIO, Sequence, Iterator
 from . import params
+from . import oscillators
 from .oscillators import Oscillator
 try:
     import numpy
@@ -131,20 +132,50 @@ class Sample:
                         samplewidth: int = params.norm_samplewidth) -> 'Sample':
         amplitude_scale = amplitude_scale or 2 ** (8 * samplewidth - 1)
         required_samples = int(duration * osc.samplerate)
-        num_blocks, last_block = divmod(required_samples, params.norm_osc_blocksize)
-        if last_block > 0:
-            num_blocks += 1
-        block_gen = osc.blocks()
-        sample = cls(None, osc.__class__.__name__, samplerate=osc.samplerate, nchannels=1, samplewidth=samplewidth)
-        if num_blocks > 0:
-            for block in block_gen:
-                num_blocks -= 1
-                if num_blocks == 0:
-                    block = block[:last_block]
-                sample.join(Sample.from_osc_block(block, osc.samplerate, amplitude_scale, samplewidth))
-                if num_blocks == 0:
+        if oscillators.numpy and required_samples > 0:
+            # the blocks are collected in a single float array that is scaled and converted in one go
+            # (values outside of the range of the sample width are clipped).
+            # this follows the oscillators module, which doesn't use numpy on pypy for instance
+            values = numpy.empty(required_samples)
+            position = 0
+            for block in osc.array_blocks():
+                size = min(len(block), required_samples - position)
+                values[position:position+size] = block[:size]
+                position += size
+                if position >= required_samples:
                     break
-        return sample
+            datatype = {
+                1: "<i1",
+                2: "<i2",
+                4: "<i4"
+            }[samplewidth]     # the sample frames are little endian
+            limits = numpy.iinfo(datatype)
+            # a finite source can end before the duration, only the samples it produced are used
+            values = values[:position]
+            values *= amplitude_scale
+            numpy.clip(values, limits.min, limits.max, out=values)
+            raw_frames = values.astype(datatype).tobytes()
+            return cls.from_raw_frames(raw_frames, samplewidth, osc.samplerate, 1, name=osc.__class__.__name__)
+        # the sample values are collected directly into a single array of the requested sample width
+        # (blocks that exceed its range are clipped, just like the numpy code does)
+        frames = cls.get_array(samplewidth)
+        if required_samples > 0:
+            extend = frames.extend      # optimization
+            maximum = 2 ** (8 * samplewidth - 1) - 1
+            minimum = -maximum - 1
+            for block in osc.blocks():
+                remaining = required_samples - len(frames)
+                if len(block) >= remaining:
+                    block = block[:remaining]
+                if block and (max(block) * amplitude_scale > maximum or min(block) * amplitude_scale < minimum):
+                    extend(max(minimum, min(maximum, int(amplitude_scale * v))) for v in block)
+                elif amplitude_scale != 1.0:
+                    extend(int(amplitude_scale * v) for v in block)
+                else:
+                    extend(map(int, block))
+                if len(frames) >= required_samples:
+                    break
+        return cls.from_array(frames, osc.samplerate, 1, name=osc.__class__.__name__)
 
     @property
     def samplewidth(self) -> int:
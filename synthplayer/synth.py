@@ -6,8 +6,11 @@ Written by Irmen de Jong (irmen@razorvine.net) - License: GNU LGPL 3.
 """
 
 import itertools
-from typing import Optional, Generator, List, Tuple
+import functools
+import random
+from typing import Callable, Optional, Generator, List, Tuple
 from . import params
+from . import oscillators
 from .sample import Sample
 from .oscillators import *
 
@@ -66,24 +69,28 @@ def major_chord_keys(rootnote: str, octave: int) -> Tuple[Tuple[str, int], Tuple
            (note_alias[keys[3]], octave+octaves[3])
 
 
+# piano key numbers of the notes in the first octave
+octave_key_numbers = {
+    "C":   4,
+    "C#":  5,
+    "D":   6,
+    "D#":  7,
+    "E":   8,
+    "F":   9,
+    "F#": 10,
+    "G":  11,
+    "G#": 12,
+    "A":  13,
+    "A#": 14,
+    "B":  15
+}
+
+
 def key_num(note: str, octave: int) -> int:
-    notes = {
-        "C":   4,
-        "C#":  5,
-        "D":   6,
-        "D#":  7,
-        "E":   8,
-        "F":   9,
-        "F#": 10,
-        "G":  11,
-        "G#": 12,
-        "A":  13,
-        "A#": 14,
-        "B":  15
-    }
-    return (octave-1)*12 + notes[note.upper()]
+    return (octave-1)*12 + octave_key_numbers[note.upper()]
 
 
+@functools.lru_cache(maxsize=None)
 def key_freq(key_number: int, a4: float = 440.0) -> float:
     """
     Return the note frequency for the given piano key number.
@@ -93,6 +100,7 @@ def key_freq(key_number: int, a4: float = 440.0) -> float:
     return 2**((key_number-49)/12) * a4
 
 
+@functools.lru_cache(maxsize=None)
 def note_freq(note: str, octave: Optional[int] = None, a4: float = 440.0) -> float:
     """
     Return the frequency for the given note in the octave.
@@ -384,50 +392,116 @@ def check_waveforms() -> None:
     except ValueError:
         pass
 
-    # check the wavesynth and generators
+    # check the wavesynth and generators: every generator must produce the same samples as the wavesynth method
     ws = WaveSynth(samplerate=1000)
-    s = ws.sine(440, 1.024)
-    sgen = ws.sine_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.square(440, 1.024)
-    sgen = ws.square_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.square_h(440, 1.024)
-    sgen = ws.square_h_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.triangle(440, 1.024)
-    sgen = ws.triangle_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.sawtooth(440, 1.024)
-    sgen = ws.sawtooth_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.sawtooth_h(440, 1.024)
-    sgen = ws.sawtooth_h_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.pulse(440, 1.024)
-    sgen = ws.pulse_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.harmonics(440, 1.024, [(n, 1/n) for n in range(1, 8)])
-    sgen = ws.harmonics_gen(440, [(n, 1/n) for n in range(1, 8)])
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert list(s.get_frame_array()) == s2
-    s = ws.white_noise(440, 1)
-    sgen = ws.white_noise_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert len(s) == 1000
-    assert len(s2) == 2*params.norm_osc_blocksize
-    s = ws.semicircle(440, 1)
-    sgen = ws.semicircle_gen(440)
-    s2 = sum(itertools.islice(sgen, 0, 2), [])
-    assert len(s) == 1000
-    assert len(s2) == 2*params.norm_osc_blocksize
+    harmonics = [(n, 1/n) for n in range(1, 8)]
+    same_waveforms = [
+        (ws.sine(440, 1.024), ws.sine_gen(440)),
+        (ws.square(440, 1.024), ws.square_gen(440)),
+        (ws.square_h(440, 1.024), ws.square_h_gen(440)),
+        (ws.triangle(440, 1.024), ws.triangle_gen(440)),
+        (ws.sawtooth(440, 1.024), ws.sawtooth_gen(440)),
+        (ws.sawtooth_h(440, 1.024), ws.sawtooth_h_gen(440)),
+        (ws.pulse(440, 1.024), ws.pulse_gen(440)),
+        (ws.harmonics(440, 1.024, harmonics), ws.harmonics_gen(440, harmonics)),
+    ]
+    for s, sgen in same_waveforms:
+        s2 = list(itertools.chain.from_iterable(itertools.islice(sgen, 0, 2)))
+        assert list(s.get_frame_array()) == s2
+    # the random and the fm-less semicircle waveforms are only checked for their lengths
+    same_lengths = [
+        (ws.white_noise(440, 1), ws.white_noise_gen(440)),
+        (ws.semicircle(440, 1), ws.semicircle_gen(440)),
+    ]
+    for s, sgen in same_lengths:
+        s2 = list(itertools.chain.from_iterable(itertools.islice(sgen, 0, 2)))
+        assert len(s) == 1000
+        assert len(s2) == 2*params.norm_osc_blocksize
+
+    # the plain python blocks() and the vectorized array_blocks() must produce the same samples, with and
+    # without numba. Also at the edges of the square and pulse waves, so some frequencies hit them exactly.
+    # (only the harmonics with FM differ a little, because the python code interpolates them from a wavetable)
+    if oscillators.numpy:
+        def fm() -> Oscillator:
+            return Sine(3, amplitude=0.3, samplerate=1000)
+
+        def pwm() -> Oscillator:
+            return Sine(2, amplitude=0.4, bias=0.5, samplerate=1000)
+
+        same_paths = [
+            lambda: Sine(440, phase=0.3, samplerate=1000),
+            lambda: Sine(440, fm_lfo=fm(), samplerate=1000),
+            lambda: Triangle(440, phase=0.3, fm_lfo=fm(), samplerate=1000),
+            lambda: Square(440, phase=0.3, samplerate=1000),
+            lambda: Square(100, fm_lfo=fm(), samplerate=1000),
+            lambda: Sawtooth(100, phase=0.3, samplerate=1000),
+            lambda: Sawtooth(440, fm_lfo=fm(), samplerate=1000),
+            lambda: Pulse(100, phase=0.3, pulsewidth=0.5, samplerate=1000),
+            lambda: Pulse(440, pulsewidth=0.25, fm_lfo=fm(), samplerate=1000),
+            lambda: Pulse(100, pwm_lfo=pwm(), samplerate=1000),
+            lambda: Harmonics(50, [(n, 1/n) for n in range(1, 8)], samplerate=1000),
+            lambda: SawtoothH(50, 6, fm_lfo=fm(), samplerate=1000),
+            lambda: Harmonics(220, [(1, 0.5), (1, 0.5), (2, 0.2)], fm_lfo=fm(), samplerate=1000),
+            lambda: Semicircle(440, phase=0.3, fm_lfo=fm(), samplerate=1000),
+            lambda: Pointy(440, phase=0.3, fm_lfo=fm(), samplerate=1000),
+            lambda: FastSine(440, phase=0.3, samplerate=1000),
+            lambda: FastTriangle(440, phase=0.3, samplerate=1000),
+            lambda: FastSquare(100, phase=0.3, samplerate=1000),
+            lambda: FastSawtooth(440, phase=0.3, samplerate=1000),
+            lambda: FastPulse(100, phase=0.3, pulsewidth=0.5, samplerate=1000),
+            lambda: FastPulse(100, pwm_lfo=pwm(), samplerate=1000),
+            lambda: FastSemicircle(440, phase=0.3, samplerate=1000),
+            lambda: FastPointy(440, phase=0.3, samplerate=1000),
+            lambda: Linear(0.5, -0.001, min_value=-0.9, samplerate=1000),
+            lambda: EnvelopeFilter(Sine(440, samplerate=1000), 0.1, 0.1, 0.2, 0.5, 0.3, stop_at_end=True),
+            lambda: MixingFilter(Sine(440, samplerate=1000), Square(100, phase=0.3, samplerate=1000)),
+            lambda: AmpModulationFilter(Sine(440, samplerate=1000), Sine(3, samplerate=1000)),
+            lambda: DelayFilter(Sine(440, samplerate=1000), 0.3),
+            lambda: EchoFilter(Triangle(440, samplerate=1000), 0.2, 3, 0.35, 0.6),
+            lambda: ClipFilter(Sine(440, samplerate=1000), -0.5, 0.3),
+            lambda: AbsFilter(Sine(440, samplerate=1000)),
+        ]   # type: List[Callable[[], Oscillator]]
+        numpy, numba = oscillators.numpy, oscillators.numba
+        try:
+            for make_osc in same_paths:
+                variants = []
+                for use_numpy, use_numba in [(None, None), (numpy, numba), (numpy, None)]:
+                    oscillators.numpy, oscillators.numba = use_numpy, use_numba     # type: ignore
+                    osc = make_osc()
+                    blocks = osc.array_blocks() if use_numpy else osc.blocks()
+                    variants.append(list(itertools.chain.from_iterable(itertools.islice(blocks, 4))))
+                samples = variants[0]
+                for array_samples in variants[1:]:
+                    assert len(samples) == len(array_samples)
+                    assert all(abs(v1-v2) < 1e-4 for v1, v2 in zip(samples, array_samples))
+            # the sample frames must be the same with and without numpy too
+            same_frames = [
+                (lambda: EchoFilter(Sine(440, samplerate=1000), 0.2, 4, 0.2, 0.6), 2.0, 2000),   # gets clipped
+                (lambda: EnvelopeFilter(Sine(440, samplerate=1000), 0.1, 0.1, 0.2, 0.5, 0.3, stop_at_end=True),
+                 1.0, 701),     # ends before the duration
+            ]   # type: List[Tuple[Callable[[], Oscillator], float, int]]
+            for make_osc, duration, num_frames in same_frames:
+                oscillators.numpy = None     # type: ignore
+                frames = list(Sample.from_oscillator(make_osc(), duration).get_frame_array())
+                oscillators.numpy = numpy
+                assert len(frames) == num_frames
+                assert frames == list(Sample.from_oscillator(make_osc(), duration).get_frame_array())
+        finally:
+            oscillators.numpy, oscillators.numba = numpy, numba
+
+    # the run length fill of the fixed frequency pulse waves must give the same samples as stepping
+    # the 32 bits phase accumulator through every sample, also around its wrap and threshold limits
+    rnd = random.Random(1)
+    for _ in range(2000):
+        phase = rnd.choice([0, 0xffffffff, 0x80000000, rnd.getrandbits(32)])
+        increment = rnd.choice([0, 1, 0xffffffff, 0x80000000, rnd.getrandbits(rnd.randint(1, 32))])
+        threshold = rnd.choice([0, 0x100000000, 0x80000000, rnd.getrandbits(32)])
+        size = rnd.randint(0, 600)
+        block, next_phase = oscillators.nco_pulse_block(phase, increment, threshold, 1.0, -1.0, size)
+        for v in block:
+            assert v == (1.0 if phase < threshold else -1.0)
+            phase = (phase + increment) & 0xffffffff
+        assert len(block) == size and next_phase == phase
 
 
 def plot_waveforms() -> None: